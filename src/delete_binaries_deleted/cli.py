@@ -4,6 +4,7 @@ Command-line interface for delete-binaries-deleted tool.
 
 import logging
 import sys
+import time
 from typing import Optional
 import click
 from rich.console import Console
@@ -14,10 +15,13 @@ from rich.panel import Panel
 from rich.text import Text
 
 from .main import BinariesDeleter
-from .database import DatabaseManager
+from .database import DatabaseManager, CREATE_BINARY_ID_INDEX_SQL
 
 console = Console()
 
+# Minimum seconds between progress bar redraws during deletion
+PROGRESS_REFRESH_SECONDS = 0.2
+
 
 def setup_logging(verbose: bool = False) -> None:
     """Setup logging configuration."""
@@ -37,10 +41,14 @@ def display_statistics(stats: dict) -> None:
     table.add_column("Metric", style="cyan", no_wrap=True)
     table.add_column("Value", style="green")
     
-    table.add_row("Total Records", f"{stats['total_records']:,}")
+    total_label = "Total Records (estimated)" if stats.get("count_is_estimate") else "Total Records"
+    table.add_row(total_label, f"{stats['total_records']:,}")
     table.add_row("Batch Size", f"{stats['batch_size']:,}")
     table.add_row("Estimated Batches", f"{stats['estimated_batches']:,}")
-    table.add_row("Estimated Time", f"{stats['estimated_time_minutes']:.1f} minutes")
+    if stats["estimated_time_minutes"] is not None:
+        table.add_row("Estimated Time", f"{stats['estimated_time_minutes']:.1f} minutes")
+    else:
+        table.add_row("Estimated Time", "Measured during deletion")
     
     if "sample_records" in stats and stats["sample_records"]:
         sample_str = ", ".join(map(str, stats["sample_records"][:5]))
@@ -63,9 +71,15 @@ def display_results(results: dict) -> None:
         table.add_column("Metric", style="cyan", no_wrap=True)
         table.add_column("Value", style="green")
         
-        table.add_row("Initial Count", f"{results['initial_count']:,}")
-        table.add_row("Final Count", f"{results['final_count']:,}")
-        table.add_row("Total Deleted", f"{results['total_deleted']:,}")
+        initial_label = "Initial Count (estimated)" if results.get("initial_count_estimated") else "Initial Count"
+        table.add_row(initial_label, f"{results['initial_count']:,}")
+        if results.get("final_count") is None:
+            table.add_row("Final Count", "not verified")
+        else:
+            final_label = "Final Count (verified)" if results.get("final_count_verified") else "Final Count"
+            table.add_row(final_label, f"{results['final_count']:,}")
+        deleted_label = "Total Deleted (estimated)" if results.get("total_deleted_estimated") else "Total Deleted"
+        table.add_row(deleted_label, f"{results['total_deleted']:,}")
         table.add_row("Batches Processed", f"{results['batches_processed']:,}")
         table.add_row("Duration", f"{results['duration_seconds']:.2f} seconds")
         
@@ -86,10 +100,57 @@ def display_results(results: dict) -> None:
 @click.command()
 @click.option(
     "--batch-size", 
-    default=400, 
+    default=10000, 
     help="Number of records to delete per batch",
     type=int
 )
+@click.option(
+    "--throttle-ms",
+    default=0,
+    help="Minimum milliseconds between batch starts (0 disables throttling)",
+    type=int
+)
+@click.option(
+    "--statement-timeout",
+    default="60s",
+    help="Server-side statement_timeout for each delete batch (PostgreSQL interval, 0 disables)"
+)
+@click.option(
+    "--lock-timeout",
+    default="5s",
+    help="Server-side lock_timeout for each delete batch (PostgreSQL interval, 0 disables)"
+)
+@click.option(
+    "--jobs", "-j",
+    default=1,
+    help="Number of parallel delete workers, each owning BinaryId % jobs",
+    type=click.IntRange(min=1)
+)
+@click.option(
+    "--truncate",
+    is_flag=True,
+    help="Remove all records with TRUNCATE instead of batched DELETE"
+)
+@click.option(
+    "--unordered",
+    is_flag=True,
+    help="Delete batches by physical row id (ctid) without ordering by BinaryId"
+)
+@click.option(
+    "--exact-count",
+    is_flag=True,
+    help="Count records with COUNT(*) instead of the planner estimate"
+)
+@click.option(
+    "--verify",
+    is_flag=True,
+    help="Recount the table with COUNT(*) after deletion instead of deriving the final count"
+)
+@click.option(
+    "--auto-index",
+    is_flag=True,
+    help="Create the recommended BinaryId index if it is missing"
+)
 @click.option(
     "--dry-run", 
     is_flag=True, 
@@ -105,9 +166,12 @@ def display_results(results: dict) -> None:
     is_flag=True, 
     help="Skip confirmation prompt"
 )
-def main(batch_size: int, dry_run: bool, verbose: bool, force: bool) -> None:
+def main(batch_size: int, throttle_ms: int, statement_timeout: str, lock_timeout: str, jobs: int, truncate: bool, unordered: bool, exact_count: bool, verify: bool, auto_index: bool, dry_run: bool, verbose: bool, force: bool) -> None:
     """Delete all records from Binaries_deleted table in batches."""
     
+    if truncate and (jobs > 1 or unordered):
+        raise click.UsageError("--truncate cannot be combined with --jobs or --unordered")
+    
     # Setup logging
     setup_logging(verbose)
     
@@ -117,9 +181,23 @@ def main(batch_size: int, dry_run: bool, verbose: bool, force: bool) -> None:
         subtitle="Safely delete all records from Binaries_deleted table"
     ))
     
+    deleter = None
     try:
         # Initialize deleter
-        deleter = BinariesDeleter(batch_size=batch_size)
+        db_manager = DatabaseManager(
+            max_connections=max(4, jobs),
+            statement_timeout=statement_timeout,
+            lock_timeout=lock_timeout
+        )
+        deleter = BinariesDeleter(
+            db_manager=db_manager,
+            batch_size=batch_size,
+            throttle_ms=throttle_ms,
+            exact_count=exact_count,
+            unordered=unordered,
+            jobs=jobs,
+            verify=verify
+        )
         
         # Validate environment
         console.print("🔍 Validating database connection...")
@@ -129,9 +207,21 @@ def main(batch_size: int, dry_run: bool, verbose: bool, force: bool) -> None:
         
         console.print("✅ Database connection validated", style="bold green")
         
+        # Index recommendation
+        if deleter.binary_id_index_present is False and not (unordered or truncate):
+            if auto_index and not dry_run:
+                console.print("\n🔧 Creating index on \"BinaryId\"...")
+                deleter.db_manager.create_binary_id_index()
+                deleter.binary_id_index_present = True
+                console.print("✅ Index created", style="bold green")
+            else:
+                console.print("\n⚠️  No index on \"BinaryId\" - each batch will sort the whole table.", style="bold yellow")
+                console.print("Create one with (or rerun with --auto-index or --unordered):", style="yellow")
+                console.print(f"  {CREATE_BINARY_ID_INDEX_SQL};", style="cyan", markup=False, highlight=False)
+        
         # Get and display statistics
         console.print("\n📊 Analyzing data...")
-        stats = deleter.get_deletion_statistics()
+        stats = deleter.dry_run() if dry_run else deleter.get_deletion_statistics()
         display_statistics(stats)
         
         if stats["total_records"] == 0:
@@ -145,15 +235,22 @@ def main(batch_size: int, dry_run: bool, verbose: bool, force: bool) -> None:
         # Confirmation
         if not force:
             console.print("\n⚠️  WARNING: This will permanently delete ALL records from Binaries_deleted table!", style="bold red")
+            if truncate:
+                console.print("TRUNCATE does not fire row-level DELETE triggers.", style="bold red")
             
             if not Confirm.ask(f"Are you sure you want to delete {stats['total_records']:,} records?"):
                 console.print("Operation cancelled by user", style="yellow")
                 return
         
-        # Progress tracking
-        def progress_callback(batch_number: int, batch_deleted: int, total_deleted: int, initial_count: int) -> None:
-            percentage = (total_deleted / initial_count) * 100 if initial_count > 0 else 0
-            console.print(f"Batch {batch_number}: {batch_deleted} deleted | Total: {total_deleted:,}/{initial_count:,} ({percentage:.1f}%)")
+        if truncate:
+            console.print("\n🗑️  Truncating table...")
+            results = deleter.truncate_all(initial_count=stats["total_records"])
+            console.print("\n")
+            display_results(results)
+            
+            if not results["success"]:
+                sys.exit(1)
+            return
         
         # Perform deletion
         console.print("\n🗑️  Starting deletion process...")
@@ -166,12 +263,26 @@ def main(batch_size: int, dry_run: bool, verbose: bool, force: bool) -> None:
             console=console
         ) as progress:
             task = progress.add_task("Deleting records...", total=stats["total_records"])
+            last_update_ts = 0.0
             
             def progress_update(batch_number: int, batch_deleted: int, total_deleted: int, initial_count: int) -> None:
-                progress.update(task, completed=total_deleted)
-                progress_callback(batch_number, batch_deleted, total_deleted, initial_count)
+                nonlocal last_update_ts
+                # Coalesce redraws: batches can complete far faster than the terminal needs
+                now = time.monotonic()
+                if now - last_update_ts < PROGRESS_REFRESH_SECONDS and total_deleted < initial_count:
+                    return
+                last_update_ts = now
+                description = f"Deleting records... batch {batch_number:,} ({total_deleted:,}/{initial_count:,})"
+                remaining_seconds = deleter.estimate_remaining_seconds(total_deleted, initial_count)
+                if remaining_seconds:
+                    description += f" ETA {remaining_seconds / 60:.1f} min"
+                progress.update(task, completed=total_deleted, description=description)
             
-            results = deleter.delete_all_records(progress_callback=progress_update)
+            results = deleter.delete_all_records(
+                progress_callback=progress_update,
+                initial_count=stats["total_records"]
+            )
+            progress.update(task, completed=results.get("total_deleted", 0))
         
         # Display results
         console.print("\n")
@@ -188,6 +299,9 @@ def main(batch_size: int, dry_run: bool, verbose: bool, force: bool) -> None:
         if verbose:
             console.print_exception()
         sys.exit(1)
+    finally:
+        if deleter is not None:
+            deleter.db_manager.close()
 
 
 if __name__ == "__main__":
@@ -2,12 +2,18 @@
 Database connection and operations module.
 """
 
+import io
+import operator
 import os
 import logging
-from typing import Optional, Tuple
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator, Optional, SupportsIndex, Tuple
 from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,53 +21,210 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Raised when a statement hits statement_timeout or lock_timeout respectively
+STATEMENT_TIMEOUT_ERROR = psycopg2.errors.QueryCanceled
+LOCK_TIMEOUT_ERROR = psycopg2.errors.LockNotAvailable
+TIMEOUT_ERRORS = (STATEMENT_TIMEOUT_ERROR, LOCK_TIMEOUT_ERROR)
 
+# Recommended index so each batch can walk "BinaryId" instead of sorting the table
+CREATE_BINARY_ID_INDEX_SQL = (
+    'CREATE INDEX CONCURRENTLY idx_binaries_deleted_binaryid '
+    'ON public."Binaries_deleted" ("BinaryId")'
+)
+
+# Name of the server-side prepared statement used by the batch delete loop
+DELETE_NEXT_BATCH_STATEMENT = "del_next_batch"
+
+# Selects and deletes the next batch in one statement; {limit} is the LIMIT placeholder
+# and {partition} an optional WHERE clause restricting the batch to one worker's rows
+DELETE_NEXT_BATCH_QUERY = '''
+    WITH victims AS (
+        SELECT "BinaryId" FROM public."Binaries_deleted"
+        {partition}
+        ORDER BY "BinaryId"
+        LIMIT {limit}
+        FOR UPDATE SKIP LOCKED
+    )
+    DELETE FROM public."Binaries_deleted" d
+    USING victims v
+    WHERE d."BinaryId" = v."BinaryId"
+'''
+
+# Unordered variant: deletes any N live rows by physical tuple id, with no sort.
+# ctid = ANY(ARRAY(...)) is used rather than ctid IN (...) so the planner picks a TID scan.
+DELETE_UNORDERED_BATCH_STATEMENT = "del_next_batch_unordered"
+DELETE_UNORDERED_BATCH_QUERY = '''
+    DELETE FROM public."Binaries_deleted"
+    WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM public."Binaries_deleted"
+        {partition}
+        LIMIT {limit}
+        FOR UPDATE SKIP LOCKED
+    ))
+'''
+
+# Restricts a batch to rows where |"BinaryId" % modulus| = remainder (parallel workers)
+PARTITION_FILTER = 'WHERE abs("BinaryId" % $2) = $3'
+
+
+def _as_binary_id(value: object) -> int:
+    """Return value as an int BinaryId, rejecting non-integral values such as 3.7 or True."""
+    # bool is an int subclass, but True/False are never meant as ids
+    if isinstance(value, bool) or not isinstance(value, SupportsIndex):
+        raise ValueError(f"BinaryId must be an integer, got {value!r}")
+    return operator.index(value)
+
+
+def _delete_batch_sql(unordered: bool = False, partitioned: bool = False) -> Tuple[str, str]:
+    """Return the prepared statement name and PREPARE-ready body for a batch DELETE."""
+    if unordered:
+        statement, query = DELETE_UNORDERED_BATCH_STATEMENT, DELETE_UNORDERED_BATCH_QUERY
+    else:
+        statement, query = DELETE_NEXT_BATCH_STATEMENT, DELETE_NEXT_BATCH_QUERY
+    
+    if partitioned:
+        return f"{statement}_partitioned", query.format(limit="$1", partition=PARTITION_FILTER)
+    return statement, query.format(limit="$1", partition="")
+
+
+def _env_field(name: str, default: Optional[str] = None,
+               convert: Optional[Callable[[str], Any]] = None, show_in_repr: bool = True) -> Any:
+    """Dataclass field whose default is read from an environment variable at construction."""
+    def factory() -> Any:
+        value = os.getenv(name, default)
+        return convert(value) if convert and value is not None else value
+    return field(default_factory=factory, repr=show_in_repr)
+
+
+@dataclass(frozen=True, slots=True)
 class DatabaseConfig:
     """Database configuration from environment variables."""
     
-    def __init__(self) -> None:
-        self.host = os.getenv("DB_HOST")
-        self.port = int(os.getenv("DB_PORT", "5432"))
-        self.database = os.getenv("DB_NAME")
-        self.user = os.getenv("DB_USER")
-        self.password = os.getenv("DB_PASSWORD")
-        
+    host: Optional[str] = _env_field("DB_HOST")
+    port: int = _env_field("DB_PORT", "5432", int)
+    database: Optional[str] = _env_field("DB_NAME")
+    user: Optional[str] = _env_field("DB_USER")
+    password: Optional[str] = _env_field("DB_PASSWORD", show_in_repr=False)
+    # PostgreSQL connection string, built once in __post_init__
+    connection_string: str = field(init=False, repr=False)
+    
+    def __post_init__(self) -> None:
         # Validate required environment variables
-        required_vars = ["DB_HOST", "DB_NAME", "DB_USER", "DB_PASSWORD"]
-        missing_vars = [var for var in required_vars if not os.getenv(var)]
+        required = {
+            "DB_HOST": self.host,
+            "DB_NAME": self.database,
+            "DB_USER": self.user,
+            "DB_PASSWORD": self.password,
+        }
+        missing_vars = [var for var, value in required.items() if not value]
         
         if missing_vars:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
-    
-    @property
-    def connection_string(self) -> str:
-        """Get PostgreSQL connection string."""
-        return f"host={self.host} port={self.port} dbname={self.database} user={self.user} password={self.password}"
+        
+        object.__setattr__(
+            self,
+            "connection_string",
+            f"host={self.host} port={self.port} dbname={self.database} user={self.user} password={self.password}"
+        )
 
 
 class DatabaseManager:
     """Manages database connections and operations."""
     
-    def __init__(self, config: Optional[DatabaseConfig] = None) -> None:
+    def __init__(self, config: Optional[DatabaseConfig] = None, max_connections: int = 4,
+                 statement_timeout: str = "60s", lock_timeout: str = "5s",
+                 idle_in_transaction_session_timeout: str = "30s") -> None:
         self.config = config or DatabaseConfig()
+        self.max_connections = max_connections
+        # Applied by delete_timeouts() to the batch delete loop only, so counts,
+        # verification and index builds are not cancelled by them
+        self.delete_timeout_settings = {
+            "statement_timeout": statement_timeout,
+            "lock_timeout": lock_timeout,
+        }
+        self.session_settings = {
+            "idle_in_transaction_session_timeout": idle_in_transaction_session_timeout,
+        }
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+    
+    @property
+    def connection_options(self) -> str:
+        """libpq startup options applying the session settings to every new connection."""
+        options = []
+        for name, value in self.session_settings.items():
+            # Spaces inside a value must be backslash-escaped in libpq options
+            escaped = str(value).replace(" ", "\\ ")
+            options.append(f"-c {name}={escaped}")
+        return " ".join(options)
+    
+    def _get_pool(self) -> ThreadedConnectionPool:
+        """Create the connection pool on first use and return it."""
+        with self._pool_lock:
+            if self._pool is None:
+                # Sent with the startup packet, so the settings cost no extra round trip
+                self._pool = ThreadedConnectionPool(
+                    1, self.max_connections, self.config.connection_string,
+                    options=self.connection_options
+                )
+                logger.info("Database connection pool created")
+            return self._pool
     
     @contextmanager
-    def get_connection(self):
-        """Get a database connection with proper cleanup."""
+    def get_connection(self) -> Iterator[connection]:
+        """Borrow a pooled autocommit connection and return it on exit.
+        
+        Every statement runs in its own transaction, so single-statement batch
+        DELETEs need no BEGIN/COMMIT round trips. Multi-statement work must issue
+        its own BEGIN.
+        """
+        pool = self._get_pool()
         conn = None
         try:
-            conn = psycopg2.connect(self.config.connection_string)
-            logger.info("Database connection established")
+            conn = pool.getconn()
+            conn.autocommit = True
+            logger.debug("Database connection acquired from pool")
             yield conn
         except psycopg2.Error as e:
             logger.error(f"Database connection error: {e}")
-            if conn:
-                conn.rollback()
             raise
         finally:
             if conn:
-                conn.close()
-                logger.info("Database connection closed")
+                pool.putconn(conn)
+                logger.debug("Database connection returned to pool")
+    
+    @contextmanager
+    def _use_connection(self, conn: Optional[connection] = None) -> Iterator[connection]:
+        """Yield the given open connection, or borrow one from the pool."""
+        if conn is not None:
+            yield conn
+        else:
+            with self.get_connection() as pooled_conn:
+                yield pooled_conn
+    
+    @contextmanager
+    def delete_timeouts(self, conn: connection) -> Iterator[connection]:
+        """Apply the batch delete timeouts to an open connection, resetting them on exit."""
+        with conn.cursor() as cursor:
+            for name, value in self.delete_timeout_settings.items():
+                cursor.execute(f"SET {name} = %s", (str(value),))
+        try:
+            yield conn
+        finally:
+            try:
+                with conn.cursor() as cursor:
+                    for name in self.delete_timeout_settings:
+                        cursor.execute(f"RESET {name}")
+            except psycopg2.Error as e:
+                logger.warning(f"Could not reset delete timeouts: {e}")
+    
+    def close(self) -> None:
+        """Close all pooled connections."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                logger.info("Database connection pool closed")
     
     def test_connection(self) -> bool:
         """Test database connection."""
@@ -70,40 +233,168 @@ class DatabaseManager:
                 with conn.cursor() as cursor:
                     cursor.execute("SELECT 1")
                     result = cursor.fetchone()
-                    return result[0] == 1
+                    return result is not None and result[0] == 1
         except Exception as e:
             logger.error(f"Connection test failed: {e}")
             return False
     
-    def count_binaries_deleted_records(self) -> int:
+    def count_binaries_deleted_records(self, conn: Optional[connection] = None) -> int:
         """Count total records in Binaries_deleted table."""
         try:
-            with self.get_connection() as conn:
+            with self._use_connection(conn) as conn:
                 with conn.cursor() as cursor:
                     cursor.execute('SELECT COUNT(*) FROM public."Binaries_deleted"')
-                    count = cursor.fetchone()[0]
+                    row = cursor.fetchone()
+                    count = int(row[0]) if row else 0
                     logger.info(f"Total records in Binaries_deleted: {count}")
                     return count
         except Exception as e:
             logger.error(f"Error counting records: {e}")
             raise
     
-    def get_binaries_deleted_batch(self, batch_size: int = 400, offset: int = 0) -> list:
-        """Get a batch of records from Binaries_deleted table."""
+    def has_binary_id_index(self) -> bool:
+        """Check whether a valid index led by "BinaryId" exists for Binaries_deleted."""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Invalid indexes (e.g. a failed CREATE INDEX CONCURRENTLY) and indexes
+                    # where "BinaryId" is not the leading key cannot serve the batch ORDER BY
+                    query = '''
+                    SELECT 1
+                    FROM pg_index i
+                    JOIN pg_class t ON t.oid = i.indrelid
+                    JOIN pg_namespace n ON n.oid = t.relnamespace
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                    WHERE n.nspname = 'public'
+                      AND t.relname = 'Binaries_deleted'
+                      AND i.indisvalid
+                      AND i.indpred IS NULL
+                      AND a.attname = %s
+                    LIMIT 1
+                    '''
+                    cursor.execute(query, ("BinaryId",))
+                    return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Error checking BinaryId index: {e}")
+            raise
+    
+    def create_binary_id_index(self) -> None:
+        """Create the recommended "BinaryId" index without blocking writers."""
+        try:
+            with self.get_connection() as conn:
+                # Pooled connections are autocommit, as CREATE INDEX CONCURRENTLY requires
+                with conn.cursor() as cursor:
+                    # Index builds can outlast any server-default timeouts, including
+                    # the phases that wait for older transactions; a cancelled build
+                    # leaves an INVALID index behind
+                    cursor.execute("SET statement_timeout = 0")
+                    cursor.execute("SET lock_timeout = 0")
+                    try:
+                        # Clear out an INVALID index left by an earlier failed build
+                        cursor.execute('''
+                            SELECT 1 FROM pg_index i
+                            WHERE i.indexrelid = to_regclass('public.idx_binaries_deleted_binaryid')
+                              AND NOT i.indisvalid
+                        ''')
+                        if cursor.fetchone() is not None:
+                            logger.warning("Dropping invalid index idx_binaries_deleted_binaryid")
+                            cursor.execute("DROP INDEX CONCURRENTLY public.idx_binaries_deleted_binaryid")
+                        cursor.execute(CREATE_BINARY_ID_INDEX_SQL)
+                    finally:
+                        cursor.execute("RESET statement_timeout")
+                        cursor.execute("RESET lock_timeout")
+                logger.info("Created index idx_binaries_deleted_binaryid")
+        except Exception as e:
+            logger.error(f"Error creating BinaryId index: {e}")
+            raise
+    
+    def estimate_count(self, conn: Optional[connection] = None) -> int:
+        """Estimate records in Binaries_deleted from planner statistics (O(1))."""
+        try:
+            with self._use_connection(conn) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        '''SELECT reltuples::bigint FROM pg_class WHERE oid = 'public."Binaries_deleted"'::regclass'''
+                    )
+                    row = cursor.fetchone()
+                    count = int(row[0]) if row else 0
+                    logger.info(f"Estimated records in Binaries_deleted: {count}")
+                    return count
+        except Exception as e:
+            logger.error(f"Error estimating record count: {e}")
+            raise
+    
+    def get_binaries_deleted_batch(self, limit: int = 10) -> list:
+        """Get a small sample of BinaryIds from Binaries_deleted (used by dry runs)."""
         try:
             with self.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                with conn.cursor() as cursor:
                     query = '''
                     SELECT "BinaryId" FROM public."Binaries_deleted"
                     ORDER BY "BinaryId" ASC 
-                    LIMIT %s OFFSET %s
+                    LIMIT %s
                     '''
-                    cursor.execute(query, (batch_size, offset))
+                    cursor.execute(query, (limit,))
                     records = cursor.fetchall()
-                    logger.debug(f"Retrieved {len(records)} records (offset: {offset})")
+                    logger.debug(f"Retrieved {len(records)} sample records")
                     return records
         except Exception as e:
-            logger.error(f"Error retrieving batch: {e}")
+            logger.error(f"Error retrieving sample records: {e}")
+            raise
+    
+    def prepare_delete_next_batch(self, conn: connection, unordered: bool = False,
+                                  partition: Optional[Tuple[int, int]] = None) -> None:
+        """Prepare the batch DELETE once on an open connection."""
+        statement, body = _delete_batch_sql(unordered, partition is not None)
+        param_types = "bigint, bigint, bigint" if partition is not None else "bigint"
+        with conn.cursor() as cursor:
+            cursor.execute(f"PREPARE {statement}({param_types}) AS " + body)
+        logger.debug(f"Prepared statement {statement}")
+    
+    def execute_delete_next_batch(self, conn: connection, batch_size: int, unordered: bool = False,
+                                  partition: Optional[Tuple[int, int]] = None) -> int:
+        """Run the prepared batch DELETE on an open connection.
+        
+        partition is a (modulus, remainder) pair restricting the batch to one worker's rows.
+        """
+        statement, _ = _delete_batch_sql(unordered, partition is not None)
+        try:
+            with conn.cursor() as cursor:
+                if partition is not None:
+                    cursor.execute(f"EXECUTE {statement}(%s, %s, %s)", (batch_size, *partition))
+                else:
+                    cursor.execute(f"EXECUTE {statement}(%s)", (batch_size,))
+                deleted_count = cursor.rowcount
+            
+            logger.debug(f"Deleted {deleted_count} records")
+            return deleted_count
+        
+        except TIMEOUT_ERRORS:
+            # The delete loop retries these itself
+            raise
+        except Exception as e:
+            logger.error(f"Error deleting batch: {e}")
+            raise
+    
+    def deallocate_delete_next_batch(self, conn: connection, unordered: bool = False,
+                                     partition: Optional[Tuple[int, int]] = None) -> None:
+        """Drop the prepared batch DELETE so the pooled connection can be reused."""
+        statement, _ = _delete_batch_sql(unordered, partition is not None)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DEALLOCATE {statement}")
+        except psycopg2.Error as e:
+            logger.warning(f"Could not deallocate prepared statement: {e}")
+    
+    def truncate_binaries_deleted(self) -> None:
+        """Remove every record from Binaries_deleted with a single TRUNCATE."""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute('TRUNCATE TABLE public."Binaries_deleted" RESTART IDENTITY')
+                logger.info("Truncated Binaries_deleted")
+        except Exception as e:
+            logger.error(f"Error truncating table: {e}")
             raise
     
     def delete_binaries_deleted_batch(self, binary_ids: list) -> int:
@@ -114,13 +405,11 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    # Use parameterized query to prevent SQL injection
-                    placeholders = ','.join(['%s'] * len(binary_ids))
-                    query = f'DELETE FROM public."Binaries_deleted" WHERE "BinaryId" IN ({placeholders})'
+                    # Bind the ids as a single array so the query text is stable
+                    query = 'DELETE FROM public."Binaries_deleted" WHERE "BinaryId" = ANY(%s::bigint[])'
                     
-                    cursor.execute(query, binary_ids)
+                    cursor.execute(query, (list(binary_ids),))
                     deleted_count = cursor.rowcount
-                    conn.commit()
                     
                     logger.info(f"Deleted {deleted_count} records")
                     return deleted_count
@@ -128,3 +417,39 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Error deleting batch: {e}")
             raise
+    
+    def delete_by_id_set(self, binary_ids: Iterable[int]) -> int:
+        """Delete a large caller-supplied set of BinaryIds.
+        
+        The ids are staged with COPY into a temporary table and removed with one
+        DELETE ... USING, avoiding a huge array parameter for the server to parse.
+        """
+        # Deduplicate so COPY cannot hit the temp table's primary key
+        unique_ids = dict.fromkeys(_as_binary_id(binary_id) for binary_id in binary_ids)
+        if not unique_ids:
+            return 0
+        payload = "\n".join(map(str, unique_ids))
+        
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Pooled connections are autocommit; the temp table needs a transaction
+                    cursor.execute("BEGIN")
+                    try:
+                        cursor.execute("CREATE TEMP TABLE _victims(bid bigint PRIMARY KEY) ON COMMIT DROP")
+                        cursor.copy_expert("COPY _victims(bid) FROM STDIN", io.StringIO(payload))
+                        cursor.execute(
+                            'DELETE FROM public."Binaries_deleted" d USING _victims v WHERE d."BinaryId" = v.bid'
+                        )
+                        deleted_count = cursor.rowcount
+                        cursor.execute("COMMIT")
+                    except Exception:
+                        cursor.execute("ROLLBACK")
+                        raise
+                    
+                    logger.info(f"Deleted {deleted_count} records")
+                    return deleted_count
+                    
+        except Exception as e:
+            logger.error(f"Error deleting id set: {e}")
+            raise
@@ -4,14 +4,29 @@ Alternative database module using only standard library (no python-dotenv).
 
 import os
 import logging
+from functools import lru_cache
 from typing import Optional, Tuple
 from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
+def _parse_env_file(env_file: str, mtime: int) -> dict:
+    """Parse a .env file; cached per path and modification time."""
+    values = {}
+    with open(env_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                key = key.strip()
+                value = value.strip().strip('"').strip("'")
+                values[key] = value
+    return values
+
+
 class DatabaseConfig:
     """Database configuration from environment variables (standard library only)."""
     
@@ -35,14 +50,8 @@ class DatabaseConfig:
     def _load_env_file(self, env_file: str = ".env") -> None:
         """Manually load .env file using standard library only."""
         try:
-            with open(env_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        key = key.strip()
-                        value = value.strip().strip('"').strip("'")
-                        os.environ[key] = value
+            mtime = os.stat(env_file).st_mtime_ns
+            os.environ.update(_parse_env_file(env_file, mtime))
         except FileNotFoundError:
             logger.warning(f"Environment file {env_file} not found")
         except Exception as e:
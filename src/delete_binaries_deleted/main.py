@@ -3,9 +3,12 @@ Main deletion logic for Binaries_deleted table.
 """
 
 import logging
+import threading
 import time
-from typing import Optional
-from .database import DatabaseManager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+from psycopg2.extensions import connection
+from .database import DatabaseManager, STATEMENT_TIMEOUT_ERROR, LOCK_TIMEOUT_ERROR
 
 logger = logging.getLogger(__name__)
 
@@ -13,11 +16,37 @@ logger = logging.getLogger(__name__)
 class BinariesDeleter:
     """Handles the deletion of all records from Binaries_deleted table."""
     
-    def __init__(self, db_manager: Optional[DatabaseManager] = None, batch_size: int = 400) -> None:
-        self.db_manager = db_manager or DatabaseManager()
+    # Consecutive lock timeouts tolerated per loop before giving up
+    max_lock_retries = 5
+    # First backoff after a lock timeout, doubled on each further one
+    lock_retry_backoff_seconds = 1.0
+    # Successful batches needed before a shrunken batch size is doubled again
+    grow_after_successes = 5
+    
+    def __init__(self, db_manager: Optional[DatabaseManager] = None, batch_size: int = 10000,
+                 throttle_ms: int = 0, exact_count: bool = False, unordered: bool = False,
+                 jobs: int = 1, verify: bool = False) -> None:
+        self.jobs = max(1, jobs)
+        self.db_manager = db_manager or DatabaseManager(max_connections=max(4, self.jobs))
         self.batch_size = batch_size
+        self.throttle_ms = throttle_ms
+        self.exact_count = exact_count
+        self.unordered = unordered
+        self.verify = verify
         self.total_deleted = 0
+        self.batches_processed = 0
         self.start_time: Optional[float] = None
+        # Guards the shared counters when several workers delete concurrently
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Moving average of measured batch durations, in seconds
+        self.average_batch_seconds: Optional[float] = None
+        # Whether "BinaryId" is indexed; None until validate_environment has checked
+        self.binary_id_index_present: Optional[bool] = None
+        # Record count taken by validate_environment, reused until a deletion runs
+        self.last_count: Optional[int] = None
+        # Whether the most recent count_records() result was an exact COUNT(*)
+        self.last_count_exact = False
     
     def validate_environment(self) -> bool:
         """Validate database connection and environment."""
@@ -28,19 +57,56 @@ class BinariesDeleter:
             return False
         
         logger.info("Database connection validated successfully")
+        
+        # Also confirms the table is readable before anything is deleted
+        try:
+            self.last_count = self.count_records()
+        except Exception as e:
+            logger.error(f"Could not count Binaries_deleted records: {e}")
+            return False
+        
+        try:
+            self.binary_id_index_present = self.db_manager.has_binary_id_index()
+            if not self.binary_id_index_present:
+                logger.warning('No index on "BinaryId"; every batch will sort the table')
+        except Exception as e:
+            logger.warning(f"Could not check BinaryId index: {e}")
+        
         return True
     
+    def count_records(self, conn: Optional[connection] = None) -> int:
+        """Count records, using the planner estimate unless an exact count was requested."""
+        if not self.exact_count:
+            estimate = self.db_manager.estimate_count(conn)
+            # reltuples is -1 (or 0) until the table has been vacuumed/analyzed
+            if estimate > 0:
+                self.last_count_exact = False
+                return estimate
+            logger.info("No usable row estimate; falling back to exact count")
+        
+        count = self.db_manager.count_binaries_deleted_records(conn)
+        self.last_count_exact = True
+        return count
+    
     def get_deletion_statistics(self) -> dict:
         """Get statistics about the deletion operation."""
         try:
-            total_records = self.db_manager.count_binaries_deleted_records()
+            if self.last_count is None:
+                self.last_count = self.count_records()
+            total_records = self.last_count
             estimated_batches = (total_records + self.batch_size - 1) // self.batch_size
             
+            # Only estimate once batch durations have actually been measured
+            estimated_time_minutes = None
+            if self.average_batch_seconds is not None:
+                estimated_time_minutes = estimated_batches * self.average_batch_seconds / 60
+            
             return {
                 "total_records": total_records,
                 "batch_size": self.batch_size,
                 "estimated_batches": estimated_batches,
-                "estimated_time_minutes": estimated_batches * 0.1  # Rough estimate
+                "estimated_time_minutes": estimated_time_minutes,
+                "count_is_estimate": not self.last_count_exact
             }
         except Exception as e:
             logger.error(f"Error getting deletion statistics: {e}")
@@ -55,11 +121,10 @@ class BinariesDeleter:
         # Get a sample of records that would be deleted
         try:
             sample_batch = self.db_manager.get_binaries_deleted_batch(
-                batch_size=min(10, stats["total_records"]), 
-                offset=0
+                limit=min(10, stats["total_records"])
             )
             
-            stats["sample_records"] = [record["BinaryId"] for record in sample_batch]
+            stats["sample_records"] = [row[0] for row in sample_batch]
             
         except Exception as e:
             logger.warning(f"Could not retrieve sample records: {e}")
@@ -67,72 +132,198 @@ class BinariesDeleter:
         
         return stats
     
-    def delete_all_records(self, progress_callback=None) -> dict:
-        """Delete all records from Binaries_deleted table in batches."""
+    def estimate_remaining_seconds(self, total_deleted: int, initial_count: int) -> Optional[float]:
+        """Estimate the time left from the measured batch average, if one exists yet."""
+        if self.average_batch_seconds is None:
+            return None
+        
+        remaining_records = max(initial_count - total_deleted, 0)
+        remaining_batches = (remaining_records + self.batch_size - 1) // self.batch_size
+        # Workers run their batches concurrently
+        return remaining_batches * self.average_batch_seconds / self.jobs
+    
+    def _record_batch_time(self, batch_duration: float, smoothing: float = 0.2) -> None:
+        """Fold a measured batch duration into the moving average."""
+        if self.average_batch_seconds is None:
+            self.average_batch_seconds = batch_duration
+        else:
+            self.average_batch_seconds += smoothing * (batch_duration - self.average_batch_seconds)
+    
+    def _throttle(self, batch_duration: float) -> None:
+        """Pad a batch out to the configured minimum interval, if any."""
+        if self.throttle_ms <= 0:
+            return
+        
+        remaining = self.throttle_ms / 1000 - batch_duration
+        if remaining > 0:
+            time.sleep(remaining)
+    
+    def _delete_loop(self, conn: connection, initial_count: int,
+                     progress_callback: Optional[Callable[..., None]] = None,
+                     partition: Optional[Tuple[int, int]] = None) -> None:
+        """Delete batches on one connection until none are left (or another worker fails)."""
+        # The timeouts cover only the batch DELETEs, not counts or verification
+        with self.db_manager.delete_timeouts(conn):
+            self.db_manager.prepare_delete_next_batch(conn, unordered=self.unordered, partition=partition)
+            batch_size = self.batch_size
+            lock_retries = 0
+            successes_since_shrink = 0
+            try:
+                while not self._stop.is_set():
+                    batch_start = time.monotonic()
+                    
+                    # Select and delete the next batch in one round trip
+                    try:
+                        deleted_count = self.db_manager.execute_delete_next_batch(
+                            conn, batch_size, unordered=self.unordered, partition=partition
+                        )
+                    except LOCK_TIMEOUT_ERROR as e:
+                        # Lock waits do not depend on batch size: back off and retry as is
+                        lock_retries += 1
+                        if lock_retries > self.max_lock_retries:
+                            raise
+                        backoff = self.lock_retry_backoff_seconds * 2 ** (lock_retries - 1)
+                        logger.warning(f"Batch hit lock timeout ({e}); retrying in {backoff:.1f}s")
+                        self._stop.wait(backoff)
+                        continue
+                    except STATEMENT_TIMEOUT_ERROR as e:
+                        if batch_size == 1:
+                            raise
+                        # Retry with a smaller batch so it fits within the statement timeout
+                        batch_size = max(1, batch_size // 2)
+                        successes_since_shrink = 0
+                        logger.warning(f"Batch timed out ({e}); retrying with batch size {batch_size}")
+                        continue
+                    
+                    lock_retries = 0
+                    if batch_size < self.batch_size:
+                        successes_since_shrink += 1
+                        if successes_since_shrink >= self.grow_after_successes:
+                            # The stall may have been transient; work back up to the configured size
+                            batch_size = min(self.batch_size, batch_size * 2)
+                            successes_since_shrink = 0
+                            logger.info(f"Increasing batch size to {batch_size}")
+                    
+                    if deleted_count == 0:
+                        logger.info("No more records to delete"
+                                    + (f" (worker {partition[1]})" if partition else ""))
+                        break
+                    
+                    batch_duration = time.monotonic() - batch_start
+                    
+                    with self._lock:
+                        self.total_deleted += deleted_count
+                        self.batches_processed += 1
+                        self._record_batch_time(batch_duration)
+                        
+                        # Progress callback
+                        if progress_callback:
+                            progress_callback(
+                                batch_number=self.batches_processed,
+                                batch_deleted=deleted_count,
+                                total_deleted=self.total_deleted,
+                                initial_count=initial_count
+                            )
+                        
+                        # DEBUG only: an INFO line per batch would break up the progress bar
+                        logger.debug(f"Batch {self.batches_processed}: Deleted {deleted_count} records (Total: {self.total_deleted})")
+                    
+                    self._throttle(batch_duration)
+            finally:
+                self.db_manager.deallocate_delete_next_batch(conn, unordered=self.unordered, partition=partition)
+    
+    def _verify_final_count(self) -> Optional[int]:
+        """Recount the table after a completed run; None if the recount itself fails."""
+        try:
+            return self.db_manager.count_binaries_deleted_records()
+        except Exception as e:
+            # Every row is already gone, so a failed recount must not fail the run
+            logger.warning(f"Could not verify final count: {e}")
+            return None
+    
+    def _delete_partition(self, worker_id: int, initial_count: int,
+                          progress_callback: Optional[Callable[..., None]] = None) -> None:
+        """Worker entry point: delete the rows where "BinaryId" % jobs == worker_id."""
+        try:
+            with self.db_manager.get_connection() as conn:
+                self._delete_loop(conn, initial_count, progress_callback, partition=(self.jobs, worker_id))
+        except Exception:
+            # Stop the other workers; the error is re-raised through the future
+            self._stop.set()
+            raise
+    
+    def delete_all_records(self, progress_callback: Optional[Callable[..., None]] = None,
+                           initial_count: Optional[int] = None) -> dict:
+        """Delete all records from Binaries_deleted table in batches.
+        
+        Pass initial_count (e.g. from get_deletion_statistics) to skip recounting.
+        """
         self.start_time = time.time()
         self.total_deleted = 0
+        self.last_count = None
+        self.batches_processed = 0
+        self._stop.clear()
         
-        logger.info(f"Starting deletion process with batch size: {self.batch_size}")
+        logger.info(
+            f"Starting deletion process with batch size: {self.batch_size}"
+            + (" (unordered)" if self.unordered else "")
+            + (f" across {self.jobs} workers" if self.jobs > 1 else "")
+        )
         
         try:
-            # Get initial count
-            initial_count = self.db_manager.count_binaries_deleted_records()
-            
-            if initial_count == 0:
-                logger.info("No records to delete")
-                return {
-                    "success": True,
-                    "initial_count": 0,
-                    "total_deleted": 0,
-                    "batches_processed": 0,
-                    "duration_seconds": 0
-                }
-            
-            batches_processed = 0
-            
-            while True:
-                # Get next batch
-                batch = self.db_manager.get_binaries_deleted_batch(
-                    batch_size=self.batch_size, 
-                    offset=0  # Always 0 since we're deleting from the beginning
-                )
-                
-                if not batch:
-                    logger.info("No more records to delete")
-                    break
-                
-                # Extract BinaryIds for deletion
-                binary_ids = [record["BinaryId"] for record in batch]
-                
-                # Delete batch
-                deleted_count = self.db_manager.delete_binaries_deleted_batch(binary_ids)
-                
-                self.total_deleted += deleted_count
-                batches_processed += 1
+            # A serial run holds one connection throughout; each batch commits on its own
+            with self.db_manager.get_connection() as conn:
+                # Get initial count
+                if initial_count is None:
+                    initial_count = self.count_records(conn)
+                initial_count_exact = self.last_count_exact
                 
-                # Progress callback
-                if progress_callback:
-                    progress_callback(
-                        batch_number=batches_processed,
-                        batch_deleted=deleted_count,
-                        total_deleted=self.total_deleted,
-                        initial_count=initial_count
-                    )
+                if initial_count == 0:
+                    logger.info("No records to delete")
+                    return {
+                        "success": True,
+                        "initial_count": 0,
+                        "initial_count_estimated": not initial_count_exact,
+                        "final_count": 0,
+                        "final_count_verified": False,
+                        "total_deleted": 0,
+                        "batches_processed": 0,
+                        "duration_seconds": 0,
+                        "average_batch_time": 0
+                    }
                 
-                logger.info(f"Batch {batches_processed}: Deleted {deleted_count} records (Total: {self.total_deleted})")
-                
-                # Small delay to prevent overwhelming the database
-                time.sleep(0.1)
+                if self.jobs == 1:
+                    self._delete_loop(conn, initial_count, progress_callback)
+            
+            if self.jobs > 1:
+                with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                    futures = [
+                        executor.submit(self._delete_partition, worker_id, initial_count, progress_callback)
+                        for worker_id in range(self.jobs)
+                    ]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except BaseException:
+                        # Let the remaining workers finish their current batch and exit
+                        self._stop.set()
+                        raise
             
             duration = time.time() - self.start_time
+            batches_processed = self.batches_processed
             
-            # Final verification
-            final_count = self.db_manager.count_binaries_deleted_records()
+            # An empty batch does not prove the table is empty: SKIP LOCKED passes over
+            # rows other sessions hold, and rows inserted during the run are deleted
+            # too, so initial minus deleted says nothing reliable either. Only a
+            # --verify rescan gives a final count; otherwise it is reported as None.
+            final_count = self._verify_final_count() if self.verify else None
             
             result = {
                 "success": True,
                 "initial_count": initial_count,
+                "initial_count_estimated": not initial_count_exact,
                 "final_count": final_count,
+                "final_count_verified": final_count is not None,
                 "total_deleted": self.total_deleted,
                 "batches_processed": batches_processed,
                 "duration_seconds": duration,
@@ -152,3 +343,50 @@ class BinariesDeleter:
                 "total_deleted": self.total_deleted,
                 "duration_seconds": duration
             }
+    
+    def truncate_all(self, initial_count: Optional[int] = None) -> dict:
+        """Remove all records from Binaries_deleted with a single TRUNCATE."""
+        self.start_time = time.time()
+        self.total_deleted = 0
+        self.last_count = None
+        
+        logger.info("Starting truncate of Binaries_deleted")
+        
+        try:
+            if initial_count is None:
+                initial_count = self.count_records()
+            initial_count_exact = self.last_count_exact
+            
+            self.db_manager.truncate_binaries_deleted()
+            # TRUNCATE reports no row count; the total is only as exact as the initial count
+            self.total_deleted = initial_count
+            
+            duration = time.time() - self.start_time
+            final_count = self._verify_final_count() if self.verify else None
+            
+            result = {
+                "success": True,
+                "initial_count": initial_count,
+                "initial_count_estimated": not initial_count_exact,
+                "final_count": final_count,
+                "final_count_verified": final_count is not None,
+                "total_deleted": initial_count,
+                "total_deleted_estimated": not initial_count_exact,
+                "batches_processed": 0,
+                "duration_seconds": duration,
+                "average_batch_time": 0
+            }
+            
+            logger.info(f"Truncate completed successfully: {result}")
+            return result
+            
+        except Exception as e:
+            duration = time.time() - self.start_time if self.start_time else 0
+            logger.error(f"Truncate failed after {duration:.2f} seconds: {e}")
+            
+            return {
+                "success": False,
+                "error": str(e),
+                "total_deleted": 0,
+                "duration_seconds": duration
+            }
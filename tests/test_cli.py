@@ -0,0 +1,45 @@
+"""
+Tests for command-line interface.
+"""
+
+from click.testing import CliRunner
+from delete_binaries_deleted.cli import console, display_results, main
+
+
+class TestOptionValidation:
+    """Test rejected option combinations."""
+    
+    def test_truncate_rejects_jobs(self):
+        """Test --truncate cannot be combined with parallel workers."""
+        result = CliRunner().invoke(main, ["--truncate", "--jobs", "4"])
+        assert result.exit_code == 2
+        assert "--truncate cannot be combined" in result.output
+    
+    def test_truncate_rejects_unordered(self):
+        """Test --truncate cannot be combined with --unordered."""
+        result = CliRunner().invoke(main, ["--truncate", "--unordered"])
+        assert result.exit_code == 2
+        assert "--truncate cannot be combined" in result.output
+
+
+class TestDisplayResults:
+    """Test the results table."""
+    
+    def test_unverified_final_count(self):
+        """Test a run without --verify shows the final count as not verified."""
+        results = {
+            "success": True,
+            "initial_count": 1000,
+            "initial_count_estimated": True,
+            "final_count": None,
+            "final_count_verified": False,
+            "total_deleted": 600,
+            "batches_processed": 2,
+            "duration_seconds": 1.0,
+            "average_batch_time": 0.5
+        }
+        
+        with console.capture() as capture:
+            display_results(results)
+        
+        assert "not verified" in capture.get()
@@ -44,6 +44,20 @@ class TestDatabaseConfig:
         config = DatabaseConfig()
         expected = "host=localhost port=5432 dbname=testdb user=testuser password=testpass"
         assert config.connection_string == expected
+    
+    @patch.dict('os.environ', {
+        'DB_HOST': 'localhost',
+        'DB_NAME': 'testdb',
+        'DB_USER': 'testuser',
+        'DB_PASSWORD': 'testpass'
+    })
+    def test_config_is_frozen(self):
+        """Test the configuration is immutable and keeps the password out of repr."""
+        config = DatabaseConfig()
+        assert config.port == 5432
+        with pytest.raises(AttributeError):
+            config.host = 'otherhost'
+        assert 'testpass' not in repr(config)
 
 
 class TestDatabaseManager:
@@ -53,6 +67,7 @@ class TestDatabaseManager:
     def test_get_connection_success(self, mock_connect):
         """Test successful database connection."""
         mock_conn = MagicMock()
+        mock_conn.closed = 0
         mock_connect.return_value = mock_conn
         
         config = MagicMock()
@@ -63,7 +78,18 @@ class TestDatabaseManager:
         with db_manager.get_connection() as conn:
             assert conn == mock_conn
         
-        mock_connect.assert_called_once_with("test_connection_string")
+        with db_manager.get_connection() as conn:
+            assert conn == mock_conn
+            assert conn.autocommit is True
+        
+        # The pooled connection is reused rather than reopened per call
+        mock_connect.assert_called_once_with(
+            "test_connection_string",
+            options="-c idle_in_transaction_session_timeout=30s"
+        )
+        mock_conn.close.assert_not_called()
+        
+        db_manager.close()
         mock_conn.close.assert_called_once()
     
     @patch('delete_binaries_deleted.database.psycopg2.connect')
@@ -97,3 +123,255 @@ class TestDatabaseManager:
         assert count == 100
         
         mock_cursor.execute.assert_called_once_with('SELECT COUNT(*) FROM public."Binaries_deleted"')
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_delete_binaries_deleted_batch_binds_array(self, mock_connect):
+        """Test deleting by id binds the ids as a single array parameter."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.rowcount = 3
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        deleted = db_manager.delete_binaries_deleted_batch([1, 2, 3])
+        assert deleted == 3
+        
+        mock_cursor.execute.assert_called_once_with(
+            'DELETE FROM public."Binaries_deleted" WHERE "BinaryId" = ANY(%s::bigint[])',
+            ([1, 2, 3],)
+        )
+    
+    def test_prepared_delete_next_batch(self):
+        """Test preparing, executing and deallocating the batch DELETE on an open connection."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.rowcount = 250
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        db_manager.prepare_delete_next_batch(mock_conn)
+        prepare_query = mock_cursor.execute.call_args[0][0]
+        assert prepare_query.startswith("PREPARE del_next_batch(bigint) AS")
+        assert "LIMIT $1" in prepare_query
+        assert "FOR UPDATE SKIP LOCKED" in prepare_query
+        assert "USING victims" in prepare_query
+        
+        deleted = db_manager.execute_delete_next_batch(mock_conn, 250)
+        assert deleted == 250
+        mock_cursor.execute.assert_called_with("EXECUTE del_next_batch(%s)", (250,))
+        
+        db_manager.deallocate_delete_next_batch(mock_conn)
+        mock_cursor.execute.assert_called_with("DEALLOCATE del_next_batch")
+        mock_conn.commit.assert_not_called()
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_estimate_count(self, mock_connect):
+        """Test estimating records from pg_class statistics."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = [5000]
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        count = db_manager.estimate_count()
+        assert count == 5000
+        
+        query = mock_cursor.execute.call_args[0][0]
+        assert "reltuples" in query
+        assert "pg_class" in query
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_has_binary_id_index(self, mock_connect):
+        """Test checking for an index on BinaryId."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = None
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        assert db_manager.has_binary_id_index() is False
+        
+        query, params = mock_cursor.execute.call_args[0]
+        assert "pg_index" in query
+        assert "indisvalid" in query
+        assert "indkey[0]" in query
+        assert params == ("BinaryId",)
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_create_binary_id_index_disables_timeouts(self, mock_connect):
+        """Test the index build runs without statement or lock timeouts."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = None
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        db_manager.create_binary_id_index()
+        
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert statements[:2] == ["SET statement_timeout = 0", "SET lock_timeout = 0"]
+        assert statements[-2:] == ["RESET statement_timeout", "RESET lock_timeout"]
+        assert any(stmt.startswith("CREATE INDEX CONCURRENTLY") for stmt in statements)
+        assert not any(stmt.startswith("DROP INDEX") for stmt in statements)
+    
+    def test_delete_timeouts_scoped_to_block(self):
+        """Test the delete timeouts are set on entry and reset on exit."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config, statement_timeout="30s", lock_timeout="2s")
+        
+        with pytest.raises(RuntimeError):
+            with db_manager.delete_timeouts(mock_conn):
+                raise RuntimeError("batch failed")
+        
+        assert [call[0] for call in mock_cursor.execute.call_args_list] == [
+            ("SET statement_timeout = %s", ("30s",)),
+            ("SET lock_timeout = %s", ("2s",)),
+            ("RESET statement_timeout",),
+            ("RESET lock_timeout",),
+        ]
+    
+    def test_prepared_delete_next_batch_unordered(self):
+        """Test the unordered batch DELETE uses ctid instead of ordering by BinaryId."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        db_manager.prepare_delete_next_batch(mock_conn, unordered=True)
+        prepare_query = mock_cursor.execute.call_args[0][0]
+        assert prepare_query.startswith("PREPARE del_next_batch_unordered(bigint) AS")
+        assert "ctid" in prepare_query
+        assert "ORDER BY" not in prepare_query
+        
+        db_manager.execute_delete_next_batch(mock_conn, 100, unordered=True)
+        mock_cursor.execute.assert_called_with("EXECUTE del_next_batch_unordered(%s)", (100,))
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_truncate_binaries_deleted(self, mock_connect):
+        """Test truncating the Binaries_deleted table."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        db_manager.truncate_binaries_deleted()
+        
+        mock_cursor.execute.assert_called_once_with('TRUNCATE TABLE public."Binaries_deleted" RESTART IDENTITY')
+    
+    def test_prepared_delete_next_batch_partitioned(self):
+        """Test a worker's batch DELETE is restricted to its BinaryId partition."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        db_manager.prepare_delete_next_batch(mock_conn, partition=(4, 1))
+        prepare_query = mock_cursor.execute.call_args[0][0]
+        assert prepare_query.startswith("PREPARE del_next_batch_partitioned(bigint, bigint, bigint) AS")
+        assert 'abs("BinaryId" % $2) = $3' in prepare_query
+        
+        db_manager.execute_delete_next_batch(mock_conn, 100, partition=(4, 1))
+        mock_cursor.execute.assert_called_with("EXECUTE del_next_batch_partitioned(%s, %s, %s)", (100, 4, 1))
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_get_binaries_deleted_batch_sample(self, mock_connect):
+        """Test sampling BinaryIds for a dry run."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [(1,), (2,), (3,)]
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        records = db_manager.get_binaries_deleted_batch(limit=3)
+        assert records == [(1,), (2,), (3,)]
+        assert mock_cursor.execute.call_args[0][1] == (3,)
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_delete_by_id_set(self, mock_connect):
+        """Test deleting a staged id set through COPY and DELETE ... USING."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.rowcount = 3
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        deleted = db_manager.delete_by_id_set(iter([5, 6, 7]))
+        assert deleted == 3
+        
+        copy_sql, payload = mock_cursor.copy_expert.call_args[0]
+        assert copy_sql == "COPY _victims(bid) FROM STDIN"
+        assert payload.getvalue() == "5\n6\n7"
+        
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert statements[0] == "BEGIN"
+        assert "USING _victims" in statements[2]
+        assert statements[-1] == "COMMIT"
+    
+    def test_delete_by_id_set_empty(self):
+        """Test an empty id set does not touch the database."""
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        assert db_manager.delete_by_id_set([]) == 0
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_delete_by_id_set_deduplicates(self, mock_connect):
+        """Test duplicate ids are staged once so COPY cannot violate the primary key."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.rowcount = 2
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_connect.return_value = mock_conn
+        
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        deleted = db_manager.delete_by_id_set([5, 6, 5, 6, 5])
+        assert deleted == 2
+        
+        payload = mock_cursor.copy_expert.call_args[0][1]
+        assert payload.getvalue() == "5\n6"
+    
+    @patch('delete_binaries_deleted.database.psycopg2.connect')
+    def test_delete_by_id_set_rejects_non_integers(self, mock_connect):
+        """Test non-integral ids are rejected before anything is deleted."""
+        config = MagicMock()
+        db_manager = DatabaseManager(config)
+        
+        with pytest.raises(ValueError, match="BinaryId must be an integer"):
+            db_manager.delete_by_id_set([1, 3.7])
+        with pytest.raises(ValueError, match="BinaryId must be an integer"):
+            db_manager.delete_by_id_set([1, True])
+        
+        mock_connect.assert_not_called()
@@ -0,0 +1,301 @@
+"""
+Tests for main deletion logic.
+"""
+
+import threading
+from contextlib import contextmanager
+
+import pytest
+from unittest.mock import MagicMock, patch
+from psycopg2.errors import LockNotAvailable, QueryCanceled
+from delete_binaries_deleted.main import BinariesDeleter
+
+
+class TestBinariesDeleterEstimates:
+    """Test time estimates derived from measured batches."""
+    
+    def test_no_estimate_before_any_batch(self):
+        """Test no remaining time is reported before a batch has been measured."""
+        deleter = BinariesDeleter(db_manager=MagicMock(), batch_size=100)
+        assert deleter.estimate_remaining_seconds(0, 1000) is None
+    
+    def test_remaining_time_from_measured_batches(self):
+        """Test the remaining time uses the moving average of batch durations."""
+        deleter = BinariesDeleter(db_manager=MagicMock(), batch_size=100, jobs=2)
+        deleter._record_batch_time(2.0)
+        
+        # 5 batches left at 2s each, split across 2 workers
+        assert deleter.estimate_remaining_seconds(500, 1000) == pytest.approx(5.0)
+        assert deleter.estimate_remaining_seconds(1200, 1000) == 0
+
+
+class TestBinariesDeleterValidation:
+    """Test environment validation."""
+    
+    def test_connection_failure(self, caplog):
+        """Test an unreachable database is reported as a connection failure."""
+        db = MagicMock()
+        db.test_connection.return_value = False
+        deleter = BinariesDeleter(db_manager=db)
+        
+        assert deleter.validate_environment() is False
+        assert "Database connection test failed" in caplog.text
+        db.estimate_count.assert_not_called()
+    
+    def test_count_failure_reported_separately(self, caplog):
+        """Test a failing count is logged as such, not as a connection failure."""
+        db = MagicMock()
+        db.test_connection.return_value = True
+        db.estimate_count.side_effect = RuntimeError('relation "Binaries_deleted" does not exist')
+        deleter = BinariesDeleter(db_manager=db)
+        
+        assert deleter.validate_environment() is False
+        assert "Could not count Binaries_deleted records" in caplog.text
+        assert "does not exist" in caplog.text
+        assert "Database connection test failed" not in caplog.text
+
+
+class FakePartitionedDatabase:
+    """In-memory stand-in for DatabaseManager's prepared-batch API."""
+    
+    def __init__(self, rows_per_partition=None, failing_worker=None):
+        self.rows_per_partition = rows_per_partition
+        self.failing_worker = failing_worker
+        self.deleted = 0
+        self.successful_batches = 0
+        self._lock = threading.Lock()
+        self._remaining = {}
+    
+    @contextmanager
+    def get_connection(self):
+        yield MagicMock()
+    
+    @contextmanager
+    def delete_timeouts(self, conn):
+        yield conn
+    
+    def prepare_delete_next_batch(self, conn, unordered=False, partition=None):
+        pass
+    
+    def deallocate_delete_next_batch(self, conn, unordered=False, partition=None):
+        pass
+    
+    def execute_delete_next_batch(self, conn, batch_size, unordered=False, partition=None):
+        worker_id = partition[1] if partition else 0
+        if worker_id == self.failing_worker:
+            raise RuntimeError("worker failed")
+        with self._lock:
+            if self.rows_per_partition is None:
+                # Unbounded table: only a stop request ends the loop
+                count = batch_size
+            else:
+                remaining = self._remaining.setdefault(worker_id, self.rows_per_partition)
+                count = min(batch_size, remaining)
+                self._remaining[worker_id] = remaining - count
+            if count:
+                self.deleted += count
+                self.successful_batches += 1
+            return count
+    
+    def count_binaries_deleted_records(self, conn=None):
+        return 0
+
+
+class TestBinariesDeleterWorkers:
+    """Test parallel deletion across partitioned workers."""
+    
+    def test_workers_share_counters(self):
+        """Test all workers' batches are tallied into the shared counters."""
+        db = FakePartitionedDatabase(rows_per_partition=250)
+        deleter = BinariesDeleter(db_manager=db, batch_size=100, jobs=4)
+        
+        result = deleter.delete_all_records(initial_count=1000)
+        
+        assert result["success"] is True
+        assert result["total_deleted"] == 1000
+        assert result["batches_processed"] == 12
+        assert db.successful_batches == 12
+    
+    def test_failing_worker_stops_the_others(self):
+        """Test one worker's error stops the rest and fails the run."""
+        db = FakePartitionedDatabase(failing_worker=1)
+        deleter = BinariesDeleter(db_manager=db, batch_size=10, jobs=4)
+        
+        result = deleter.delete_all_records(initial_count=1000)
+        
+        assert result["success"] is False
+        assert "worker failed" in result["error"]
+        assert deleter._stop.is_set()
+        # The other workers exited, and every batch they finished was counted
+        assert result["total_deleted"] == db.deleted
+        assert deleter.batches_processed == db.successful_batches
+
+
+class ScriptedDatabase(FakePartitionedDatabase):
+    """Fake database whose batch results (counts or exceptions) follow a script."""
+    
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.batch_sizes = []
+    
+    def execute_delete_next_batch(self, conn, batch_size, unordered=False, partition=None):
+        self.batch_sizes.append(batch_size)
+        outcome = self.script.pop(0) if self.script else 0
+        if isinstance(outcome, Exception):
+            raise outcome
+        return min(outcome, batch_size)
+
+
+class TestBinariesDeleterRetries:
+    """Test the delete loop's timeout handling and throttling."""
+    
+    def make_deleter(self, script, batch_size=8):
+        db = ScriptedDatabase(script)
+        deleter = BinariesDeleter(db_manager=db, batch_size=batch_size)
+        deleter.lock_retry_backoff_seconds = 0
+        return deleter, db
+    
+    def test_statement_timeout_halves_batch(self):
+        """Test a statement timeout retries the batch at half the size."""
+        deleter, db = self.make_deleter([QueryCanceled(), QueryCanceled(), 2, 0])
+        
+        result = deleter.delete_all_records(initial_count=2)
+        
+        assert result["success"] is True
+        assert result["total_deleted"] == 2
+        assert db.batch_sizes[:3] == [8, 4, 2]
+    
+    def test_statement_timeout_gives_up_at_one_row(self):
+        """Test the run fails once a single-row batch still times out."""
+        deleter, db = self.make_deleter([QueryCanceled()] * 5, batch_size=4)
+        
+        result = deleter.delete_all_records(initial_count=10)
+        
+        assert result["success"] is False
+        assert db.batch_sizes == [4, 2, 1]
+    
+    def test_lock_timeout_retries_at_same_size(self):
+        """Test a lock timeout is retried without shrinking the batch."""
+        deleter, db = self.make_deleter([LockNotAvailable(), LockNotAvailable(), 8, 0])
+        
+        result = deleter.delete_all_records(initial_count=8)
+        
+        assert result["success"] is True
+        assert db.batch_sizes[:3] == [8, 8, 8]
+    
+    def test_lock_timeout_gives_up_after_retries(self):
+        """Test repeated lock timeouts eventually fail the run."""
+        deleter, db = self.make_deleter([LockNotAvailable()] * 10)
+        
+        result = deleter.delete_all_records(initial_count=8)
+        
+        assert result["success"] is False
+        assert len(db.batch_sizes) == deleter.max_lock_retries + 1
+    
+    def test_batch_size_grows_back_after_successes(self):
+        """Test a shrunken batch size is doubled again after enough successful batches."""
+        script = [QueryCanceled()] + [4] * BinariesDeleter.grow_after_successes + [8, 0]
+        deleter, db = self.make_deleter(script)
+        
+        result = deleter.delete_all_records(initial_count=100)
+        
+        assert result["success"] is True
+        assert db.batch_sizes[1:1 + BinariesDeleter.grow_after_successes] == [4] * BinariesDeleter.grow_after_successes
+        assert db.batch_sizes[1 + BinariesDeleter.grow_after_successes] == 8
+    
+    def test_throttle_pads_fast_batches(self):
+        """Test throttling sleeps only for the unused part of the interval."""
+        deleter = BinariesDeleter(db_manager=MagicMock(), throttle_ms=100)
+        
+        with patch('delete_binaries_deleted.main.time.sleep') as mock_sleep:
+            deleter._throttle(0.04)
+            mock_sleep.assert_called_once_with(pytest.approx(0.06))
+            
+            mock_sleep.reset_mock()
+            deleter._throttle(0.2)
+            mock_sleep.assert_not_called()
+
+
+class CountingDatabase(ScriptedDatabase):
+    """Scripted fake that also answers estimated and exact counts."""
+    
+    def __init__(self, script, estimate, exact):
+        super().__init__(script)
+        self.estimate = estimate
+        self.exact = exact
+        self.truncated = False
+    
+    def estimate_count(self, conn=None):
+        return self.estimate
+    
+    def count_binaries_deleted_records(self, conn=None):
+        return self.exact
+    
+    def truncate_binaries_deleted(self):
+        self.truncated = True
+
+
+class TestBinariesDeleterFinalCount:
+    """Test how the final and deleted counts are reported."""
+    
+    def test_final_count_unverified_without_verify(self):
+        """Test no final count is claimed without --verify, even from an exact initial count."""
+        db = CountingDatabase([300, 300, 0], estimate=1000, exact=650)
+        deleter = BinariesDeleter(db_manager=db, batch_size=300, exact_count=True)
+        
+        result = deleter.delete_all_records()
+        
+        assert result["success"] is True
+        assert result["initial_count"] == 650
+        assert result["initial_count_estimated"] is False
+        assert result["total_deleted"] == 600
+        assert result["final_count"] is None
+        assert result["final_count_verified"] is False
+    
+    def test_verify_recounts(self):
+        """Test --verify reports an exact recount."""
+        db = CountingDatabase([300, 0], estimate=300, exact=7)
+        deleter = BinariesDeleter(db_manager=db, batch_size=300, verify=True)
+        
+        result = deleter.delete_all_records()
+        
+        assert result["final_count"] == 7
+        assert result["final_count_verified"] is True
+    
+    def test_failed_recount_does_not_fail_run(self):
+        """Test a --verify recount timeout leaves a completed run successful but unverified."""
+        db = CountingDatabase([300, 0], estimate=300, exact=7)
+        db.count_binaries_deleted_records = MagicMock(side_effect=QueryCanceled())
+        deleter = BinariesDeleter(db_manager=db, batch_size=300, verify=True)
+        
+        result = deleter.delete_all_records()
+        
+        assert result["success"] is True
+        assert result["total_deleted"] == 300
+        assert result["final_count"] is None
+        assert result["final_count_verified"] is False
+    
+    def test_truncate_marks_estimated_total(self):
+        """Test TRUNCATE reports an estimated initial count as an estimated total."""
+        db = CountingDatabase([], estimate=1000, exact=600)
+        deleter = BinariesDeleter(db_manager=db)
+        
+        result = deleter.truncate_all()
+        
+        assert db.truncated is True
+        assert result["success"] is True
+        assert result["total_deleted"] == 1000
+        assert result["total_deleted_estimated"] is True
+        assert result["initial_count_estimated"] is True
+        assert result["final_count"] is None
+    
+    def test_truncate_with_exact_count(self):
+        """Test TRUNCATE with an exact count reports the exact total."""
+        db = CountingDatabase([], estimate=1000, exact=600)
+        deleter = BinariesDeleter(db_manager=db, exact_count=True)
+        
+        result = deleter.truncate_all()
+        
+        assert result["total_deleted"] == 600
+        assert result["total_deleted_estimated"] is False